@@ -1,5 +1,5 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
-from fastapi.responses import RedirectResponse
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import RedirectResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from slowapi import Limiter, _rate_limit_exceeded_handler
@@ -7,11 +7,14 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from src.inference import ClusterPredictor
 from src.llm import PersonaExplainer
+from src.cache import MsgpackZstdDisk
 import os
-import requests
-import uuid
-import time
+import asyncio
+import httpx
+from aiolimiter import AsyncLimiter
+import secrets
 import random
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from diskcache import Cache
 from typing import Optional, Dict, Any
@@ -35,11 +38,15 @@ while True:
 
 print(f"Loaded {len(DUNE_API_KEYS)} Dune API Keys.")
 
+# Per-key Dune request budget, and how often a 429 is retried before giving up
+DUNE_REQUESTS_PER_MINUTE = int(os.getenv("DUNE_REQUESTS_PER_MINUTE", "40"))
+DUNE_MAX_RETRIES = 5
+
 # Initialize Limiter
 limiter = Limiter(key_func=get_remote_address)
 
 # --- Helper: Contract Check ---
-def check_is_contract(wallet_address: str) -> bool:
+async def check_is_contract(wallet_address: str) -> bool:
     """
     Checks if an address is a smart contract using a public RPC.
     Returns True if contract, False if EOA (User).
@@ -53,7 +60,7 @@ def check_is_contract(wallet_address: str) -> bool:
     }
     
     try:
-        res = requests.post(rpc_url, json=payload, timeout=5)
+        res = await app.state.http.post(rpc_url, json=payload, timeout=5)
         if res.status_code == 200:
             result = res.json().get("result")
             # '0x' means no code (EOA). Anything longer means Contract.
@@ -64,7 +71,93 @@ def check_is_contract(wallet_address: str) -> bool:
     
     return False
 
-app = FastAPI(title="Crypto Wallet Persona API", description="Async API with AI-powered Wallet Analysis.")
+# --- Helper: Rate-Limited Dune Calls ---
+def _dune_pause_seconds(res: httpx.Response, attempt: int) -> float:
+    """
+    How long callers on this key should hold off after the given response.
+    """
+    retry_after = res.headers.get("Retry-After")
+    if retry_after is not None:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    if res.status_code == 429:
+        return float(2 ** attempt)
+    return 0.0
+
+async def dune_request(api_key: str, method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Sends a Dune API request through that key's token bucket.
+    A 429 pauses every job sharing the key (Retry-After if given, otherwise
+    exponential backoff) and the call is retried up to DUNE_MAX_RETRIES times.
+    """
+    limiter = app.state.dune_limiters[api_key]
+    cooldown = app.state.dune_cooldown
+    loop = asyncio.get_running_loop()
+
+    for attempt in range(DUNE_MAX_RETRIES + 1):
+        # Wait out any pause another job triggered on this key
+        wait = cooldown.get(api_key, 0.0) - loop.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        async with limiter:
+            res = await app.state.http.request(
+                method, url, headers={"X-Dune-API-Key": api_key}, **kwargs
+            )
+
+        pause = _dune_pause_seconds(res, attempt)
+        if pause:
+            cooldown[api_key] = max(cooldown.get(api_key, 0.0), loop.time() + pause)
+        if res.status_code != 429 or attempt == DUNE_MAX_RETRIES:
+            return res
+        print(f"Dune rate limit hit, retrying in {pause:.0f}s...")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One shared client for the whole worker: all Dune/RPC calls reuse pooled
+    # keep-alive (HTTP/2) connections instead of opening a socket per request.
+    app.state.http = httpx.AsyncClient(
+        timeout=15,
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    )
+    # Proactive token bucket per Dune key so concurrent jobs stay under quota
+    app.state.dune_limiters = {
+        key: AsyncLimiter(DUNE_REQUESTS_PER_MINUTE, time_period=60) for key in DUNE_API_KEYS
+    }
+    app.state.dune_cooldown: Dict[str, float] = {}
+    # Bounded job queue: at most ANALYSIS_WORKERS Dune pipelines run at once,
+    # the rest wait here instead of piling up as unbounded background tasks.
+    app.state.analysis_queue = asyncio.Queue(maxsize=ANALYSIS_QUEUE_SIZE)
+    # wallet_address -> job_id for analyses queued or running, so duplicate
+    # requests join the existing job instead of re-querying Dune.
+    app.state.pending: Dict[str, str] = {}
+    # job_id -> Event set on every state change, so status long-polls wake immediately
+    app.state.events: Dict[str, asyncio.Event] = {}
+    workers = [
+        asyncio.create_task(analysis_worker(app.state.analysis_queue))
+        for _ in range(ANALYSIS_WORKERS)
+    ]
+    yield
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    # Jobs that never started would otherwise stay "queued" in the cache
+    queue = app.state.analysis_queue
+    while not queue.empty():
+        job_id, wallet_address = queue.get_nowait()
+        fail_unfinished_job(job_id, wallet_address)
+    await app.state.http.aclose()
+
+# orjson encodes the result payloads (float scores + long explanation) much faster than stdlib json
+app = FastAPI(
+    title="Crypto Wallet Persona API",
+    description="Async API with AI-powered Wallet Analysis.",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
@@ -95,10 +188,20 @@ PREPROCESSOR_PATH = os.path.join(BASE_DIR, "wallet_power_transformer.pkl")
 CACHE_DIR = os.path.join(BASE_DIR, "cache_data")
 
 # Initialize Components
-cache = Cache(CACHE_DIR)
+# Results are stored as compressed msgpack rather than pickle (smaller, faster to read back)
+cache = Cache(CACHE_DIR, disk=MsgpackZstdDisk)
 # Expire cache entries after 24 hours (86400 seconds)
 CACHE_TTL = 86400 
 
+# Concurrent analyses per worker process, and how many may wait in line
+ANALYSIS_WORKERS = 8
+ANALYSIS_QUEUE_SIZE = 1000
+# How long /analyze/status holds an unfinished job before answering with its current state
+STATUS_LONG_POLL_TIMEOUT = 25.0
+# Fallback hold when this process has no Event for the job (another worker's job,
+# or one left over from before a restart), so clients can't spin on it
+STATUS_POLL_INTERVAL = 2.0
+
 try:
     predictor = ClusterPredictor(model_path=MODEL_PATH, preprocessor_path=PREPROCESSOR_PATH)
     explainer = PersonaExplainer()
@@ -123,14 +226,23 @@ class AnalysisResult(BaseModel):
     error: Optional[str] = None
 
 # --- Background Worker ---
-def process_wallet_analysis(job_id: str, wallet_address: str):
+def set_job_state(job_id: str, state: dict, expire: int = CACHE_TTL):
+    """
+    Stores the job state and wakes any status requests waiting on this job.
+    """
+    cache.set(job_id, state, expire=expire)
+    event = app.state.events.get(job_id)
+    if event is not None:
+        event.set()
+
+async def process_wallet_analysis(job_id: str, wallet_address: str):
     """
     Background task that fetches data, predicts persona, and generates AI explanation.
     Updates the cache state as it progresses.
     """
     try:
         # Update status to processing
-        cache.set(job_id, {"status": "processing", "wallet": wallet_address}, expire=CACHE_TTL)
+        set_job_state(job_id, {"status": "processing", "wallet": wallet_address})
         
         # 1. Execute Dune Query (Start New Run)
         if not DUNE_API_KEYS:
@@ -141,11 +253,10 @@ def process_wallet_analysis(job_id: str, wallet_address: str):
 
         # Step A: Submit Execution
         execute_url = "https://api.dune.com/api/v1/query/6252521/execute"
-        headers = {"X-Dune-API-Key": selected_api_key}
         payload = {"query_parameters": {"wallet": wallet_address}}
         
         print(f"Submitting Dune query for {wallet_address}...")
-        exec_res = requests.post(execute_url, headers=headers, json=payload, timeout=10)
+        exec_res = await dune_request(selected_api_key, "POST", execute_url, json=payload, timeout=10)
         
         if exec_res.status_code != 200:
             raise Exception(f"Dune Execution Failed: {exec_res.status_code} - {exec_res.text}")
@@ -160,10 +271,10 @@ def process_wallet_analysis(job_id: str, wallet_address: str):
         
         max_retries = 150 # 150 * 2s = 300s (5 mins) max wait
         for i in range(max_retries):
-            status_res = requests.get(status_url, headers=headers, timeout=10)
+            status_res = await dune_request(selected_api_key, "GET", status_url, timeout=10)
             if status_res.status_code != 200:
                  # Temporary network glitch? Wait and retry.
-                 time.sleep(2)
+                 await asyncio.sleep(2)
                  continue
                  
             state = status_res.json().get("state")
@@ -174,13 +285,13 @@ def process_wallet_analysis(job_id: str, wallet_address: str):
             elif state == "QUERY_STATE_CANCELLED":
                 raise Exception("Dune Query was CANCELLED.")
                 
-            time.sleep(2)
+            await asyncio.sleep(2)
         else:
             raise Exception("Dune Query Timed Out (60s).")
 
         # Step C: Fetch Results
         results_url = f"https://api.dune.com/api/v1/execution/{execution_id}/results"
-        results_res = requests.get(results_url, headers=headers, timeout=15)
+        results_res = await dune_request(selected_api_key, "GET", results_url, timeout=15)
         
         if results_res.status_code != 200:
              raise Exception(f"Failed to fetch results: {results_res.status_code}")
@@ -201,16 +312,15 @@ def process_wallet_analysis(job_id: str, wallet_address: str):
         # 2. Heuristic Analysis & Prediction
         
         # A. Contract Check
-        is_contract = check_is_contract(wallet_address)
+        is_contract = await check_is_contract(wallet_address)
         
         # B. Feature Extraction
         if predictor is None:
              raise Exception("Inference Model not loaded.")
 
-        model_input = {}
-        for feature in predictor.FEATURES:
-            val = row_data.get(feature)
-            model_input[feature] = float(val) if val is not None else 0.0
+        # Values in predictor.FEATURES order (missing/null -> 0.0); the stats dict is derived from them
+        feature_values = tuple(float(row_data.get(f) or 0.0) for f in predictor.FEATURES)
+        model_input = dict(zip(predictor.FEATURES, feature_values))
 
         # C. Decide Persona (Hybrid: Rules + AI)
         final_persona = None
@@ -236,17 +346,14 @@ def process_wallet_analysis(job_id: str, wallet_address: str):
             }
         else:
             # Run AI Inference
-            prediction_result = predictor.predict(model_input)
+            prediction_result = predictor.predict_row(feature_values)
             final_persona = prediction_result['persona']
             confidence = prediction_result['probabilities']
         
         # 3. Generate AI Explanation
         explanation = "AI Analysis unavailable."
         if explainer:
-            explanation = explainer.generate_explanation(
-                final_persona, 
-                model_input
-            )
+            explanation = await explainer.generate_explanation_async(final_persona, model_input)
 
         # 4. Save Final Result to Cache
         final_result = {
@@ -259,7 +366,7 @@ def process_wallet_analysis(job_id: str, wallet_address: str):
         }
         
         # Cache key for the JOB
-        cache.set(job_id, final_result, expire=CACHE_TTL)
+        set_job_state(job_id, final_result)
         
         # ALSO Cache key for the WALLET (for instant lookup later)
         # We prefix with 'wallet:' to distinguish from job_ids
@@ -273,7 +380,37 @@ def process_wallet_analysis(job_id: str, wallet_address: str):
             "wallet_address": wallet_address,
             "error": str(e)
         }
-        cache.set(job_id, error_state, expire=CACHE_TTL)
+        set_job_state(job_id, error_state)
+
+def fail_unfinished_job(job_id: str, wallet_address: str):
+    """
+    Marks a job failed if it never reached a terminal state (e.g. cancelled at
+    shutdown), so clients stop polling a job nobody will finish.
+    """
+    job = cache.get(job_id) or {}
+    if job.get("status") not in ("completed", "failed"):
+        set_job_state(job_id, {
+            "status": "failed",
+            "wallet_address": wallet_address,
+            "error": "Server restarted, please retry."
+        })
+
+async def analysis_worker(queue: asyncio.Queue):
+    """
+    Pulls (job_id, wallet_address) pairs off the queue and runs them one at a time.
+    """
+    while True:
+        job_id, wallet_address = await queue.get()
+        try:
+            await process_wallet_analysis(job_id, wallet_address)
+        finally:
+            fail_unfinished_job(job_id, wallet_address)
+            app.state.pending.pop(wallet_address, None)
+            # Release any long-polls still parked on this job (e.g. on cancellation)
+            event = app.state.events.pop(job_id, None)
+            if event is not None:
+                event.set()
+            queue.task_done()
 
 # --- Endpoints ---
 
@@ -283,7 +420,7 @@ def home():
 
 @app.post("/analyze/start/{wallet_address}", response_model=JobResponse)
 @limiter.limit("5/minute")
-def start_analysis(wallet_address: str, background_tasks: BackgroundTasks, request: Request):
+async def start_analysis(wallet_address: str, request: Request):
     """
     Starts the analysis job. Returns a job_id immediately.
     Checks cache first for instant results.
@@ -294,25 +431,62 @@ def start_analysis(wallet_address: str, background_tasks: BackgroundTasks, reque
         # Create a "virtual" completed job for API consistency
         # Or we could just return the result directly? 
         # For this pattern, let's return a completed job_id that points to this data
-        job_id = f"cached_{uuid.uuid4().hex[:8]}"
+        job_id = f"cached_{secrets.token_hex(4)}"
         cache.set(job_id, cached_result, expire=300) # Short TTL for temp job pointer
         return {"job_id": job_id, "status": "completed", "wallet_address": wallet_address}
 
-    # 2. Start New Job
-    job_id = str(uuid.uuid4())
+    # 2. Join an analysis already in flight for this wallet
+    pending = request.app.state.pending
+    if wallet_address in pending:
+        job_id = pending[wallet_address]
+        job = cache.get(job_id) or {}
+        return {"job_id": job_id, "status": job.get("status", "queued"), "wallet_address": wallet_address}
+
+    # 3. Start New Job
+    queue = request.app.state.analysis_queue
+    if queue.full():
+        raise HTTPException(status_code=503, detail="Too many analyses in progress. Please retry shortly.")
+
+    job_id = secrets.token_hex(16)
     cache.set(job_id, {"status": "queued", "wallet": wallet_address}, expire=CACHE_TTL)
     
-    background_tasks.add_task(process_wallet_analysis, job_id, wallet_address)
+    pending[wallet_address] = job_id
+    request.app.state.events[job_id] = asyncio.Event()
+    queue.put_nowait((job_id, wallet_address))
     
     return {"job_id": job_id, "status": "queued", "wallet_address": wallet_address}
 
 @app.get("/analyze/status/{job_id}", response_model=AnalysisResult)
-def check_status(job_id: str):
+async def check_status(job_id: str, request: Request, response: Response):
     """
     Poll this endpoint to get the result.
+    While the job is still queued/processing the request is held for up to
+    STATUS_LONG_POLL_TIMEOUT seconds and answers as soon as the state changes.
     """
     result = cache.get(job_id)
     if not result:
         raise HTTPException(status_code=404, detail="Job ID not found or expired.")
-    
-    return result
\ No newline at end of file
+
+    if result["status"] not in ("completed", "failed"):
+        event = request.app.state.events.get(job_id)
+        if event is not None:
+            # The read above is the latest state, so only a change after it should wake us
+            event.clear()
+            try:
+                await asyncio.wait_for(event.wait(), timeout=STATUS_LONG_POLL_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            await asyncio.sleep(STATUS_POLL_INTERVAL)
+        result = cache.get(job_id) or result
+
+    if result["status"] not in ("completed", "failed"):
+        response.headers["Cache-Control"] = "no-store"
+        return result
+
+    # Terminal states never change for a job_id, so the ETag only needs both
+    etag = f'"{job_id}-{result["status"]}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return result
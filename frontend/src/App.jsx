@@ -135,27 +135,30 @@ function App() {
     }
   };
 
-  const pollStatus = (jobId) => {
-    const interval = setInterval(async () => {
+  const pollStatus = async (jobId) => {
+    // The status endpoint long-polls; still pause between non-terminal replies
+    // in case the server answered without holding the request
+    while (true) {
       try {
         const res = await axios.get(`${API_BASE}/analyze/status/${jobId}`);
         const result = res.data;
         
         if (result.status === "completed") {
-          clearInterval(interval);
           setData(result);
           setStatus("success");
+          return;
         } else if (result.status === "failed") {
-          clearInterval(interval);
           setErrorMsg(result.error || "Analysis Failed");
           setStatus("error");
+          return;
         }
+        await new Promise((resolve) => setTimeout(resolve, 2000));
       } catch (err) {
-        clearInterval(interval);
         setErrorMsg("POLLING_ERR: Lost connection");
         setStatus("error");
+        return;
       }
-    }, 2000);
+    }
   };
 
   const handleExport = () => {
@@ -0,0 +1,25 @@
+# Train and visualize in one process: the labeled DataFrame goes straight from
+# train_model() to the plots instead of round-tripping through the labeled file.
+# Run train.py / visualize_clusters.py separately to get the labeled dataset on disk.
+import argparse
+
+# train first: it patches sklearn (sklearnex) before anything else imports it
+from train import train_model
+from visualize_clusters import transform_features, plot_radar_chart, plot_tsne
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrain the model and regenerate the cluster plots.")
+    parser.add_argument("--save-labeled", action="store_true", help="Also write the labeled dataset to disk")
+    args = parser.parse_args()
+
+    df = train_model(save_labeled=args.save_labeled)
+    if df is None:
+        return
+
+    X = transform_features(df)
+    plot_radar_chart(df, X)
+    plot_tsne(df, X)
+    print("Training and visualization complete.")
+
+if __name__ == "__main__":
+    main()
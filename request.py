@@ -1,59 +1,124 @@
-import requests
-import csv
-import time
+import asyncio
+import httpx
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from aiolimiter import AsyncLimiter
 from dotenv import load_dotenv
 import os
 load_dotenv()
 
 API_KEY = os.getenv("DUNE_API_KEY")
 
+BASE_URL = "https://api.dune.com/api/v1"
 QUERY_ID = "6246979"
 LIMIT = 1000
-offset = 0
+# Pages in flight at once, and the overall Dune request budget
+CONCURRENCY = 8
+REQUESTS_PER_MINUTE = int(os.getenv("DUNE_REQUESTS_PER_MINUTE", "40"))
+# Timeouts, network errors, 429 and 5xx are retried with exponential backoff
+MAX_RETRIES = 8
+RETRY_BASE_DELAY = 5
+RETRY_MAX_DELAY = 60
 
 output_file = "wallet_dataset.csv"
-first_page = True
 
-print("Downloading full dataset from Dune…")
+async def dune_get(client: httpx.AsyncClient, limiter: AsyncLimiter, semaphore: asyncio.Semaphore, url: str, params: dict, what: str) -> httpx.Response:
+    """
+    GETs one Dune resource under the rate limit, retrying transient failures.
+    The body is only downloaded once the status is known to be final; pyarrow's
+    CSV reader is synchronous, so a page is read fully before parsing.
+    Raises once MAX_RETRIES is exhausted, rather than saving a dataset with holes.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        delay = min(RETRY_BASE_DELAY * 2 ** attempt, RETRY_MAX_DELAY)
+        async with semaphore, limiter:
+            print(f"Fetching {what} ...")
+            try:
+                async with client.stream("GET", url, params=params) as r:
+                    if r.status_code != 429 and r.status_code < 500:
+                        await r.aread()
+                        return r
+                    reason = f"HTTP {r.status_code}"
+            except httpx.TimeoutException:
+                reason = "Timeout"
+            except httpx.TransportError as e:
+                reason = f"Network error ({e})"
 
-while True:
-    url = f"https://api.dune.com/api/v1/query/{QUERY_ID}/results/csv?limit={LIMIT}&offset={offset}"
-    headers = {"X-Dune-API-Key": API_KEY}
+        if attempt == MAX_RETRIES:
+            raise RuntimeError(f"{reason} fetching {what}, giving up after {MAX_RETRIES} retries.")
+        # Back off outside the semaphore so other pages keep flowing
+        print(f"{reason} fetching {what}. Retrying in {delay} seconds…")
+        await asyncio.sleep(delay)
+
+async def fetch_total_rows(client: httpx.AsyncClient, limiter: AsyncLimiter, semaphore: asyncio.Semaphore) -> int | None:
+    """Reads the result size from the JSON results metadata (one row fetched)."""
+    r = await dune_get(client, limiter, semaphore, f"{BASE_URL}/query/{QUERY_ID}/results", {"limit": 1}, "row count")
+    if r.status_code != 200:
+        return None
+    return r.json().get("result", {}).get("metadata", {}).get("total_row_count")
 
-    print(f"Fetching offset {offset} ...")
+async def fetch_page(client: httpx.AsyncClient, limiter: AsyncLimiter, semaphore: asyncio.Semaphore, offset: int) -> pa.Table | None:
+    """Fetches one CSV page as an Arrow table; None once Dune has no rows past this offset."""
+    url = f"{BASE_URL}/query/{QUERY_ID}/results/csv"
+    params = {"limit": LIMIT, "offset": offset}
 
-    try:
-        r = requests.get(url, headers=headers, timeout=40)
+    r = await dune_get(client, limiter, semaphore, url, params, f"offset {offset}")
+    r.raise_for_status()
+    if not r.content.strip():
+        return None
+    return pacsv.read_csv(pa.BufferReader(r.content))
 
-    except requests.exceptions.Timeout:
-        print("Timeout. Retrying in 5 seconds…")
-        time.sleep(5)
-        continue
+async def main():
+    if not API_KEY:
+        print("Error: DUNE_API_KEY is not set.")
+        return
 
-    except Exception as e:
-        print(f"Network error: {e}. Retrying…")
-        time.sleep(5)
-        continue
+    print("Downloading full dataset from Dune…")
+
+    limiter = AsyncLimiter(REQUESTS_PER_MINUTE, time_period=60)
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    headers = {"X-Dune-API-Key": API_KEY}
 
-    if len(r.text.strip()) == 0 or r.status_code != 200:
-        print("No more rows or bad response. Finished.")
-        break
+    async with httpx.AsyncClient(headers=headers, timeout=40) as client:
+        total = await fetch_total_rows(client, limiter, semaphore)
 
-    lines = r.text.splitlines()
-    if len(lines) <= 1:
-        print("Reached the last partial page. Stopping.")
-        break
+        if total is not None:
+            # Pagination is stateless, so every page can be requested up front
+            print(f"{total} rows across {-(-total // LIMIT)} pages.")
+            pages = await asyncio.gather(*(
+                fetch_page(client, limiter, semaphore, offset)
+                for offset in range(0, total, LIMIT)
+            ))
+            tables = [t for t in pages if t is not None and t.num_rows > 0]
+        else:
+            # Size unknown: fetch a wave of pages at a time until one comes back short
+            print("Total row count unavailable, fetching in waves.")
+            tables = []
+            offset = 0
+            done = False
+            while not done:
+                wave = await asyncio.gather(*(
+                    fetch_page(client, limiter, semaphore, offset + k * LIMIT)
+                    for k in range(CONCURRENCY)
+                ))
+                for table in wave:
+                    if table is None or table.num_rows == 0:
+                        done = True
+                        break
+                    tables.append(table)
+                    if table.num_rows < LIMIT:
+                        done = True
+                        break
+                offset += CONCURRENCY * LIMIT
 
-    mode = 'w' if first_page else 'a'
-    with open(output_file, mode, newline='') as f:
-        writer = csv.writer(f)
-        for i, line in enumerate(lines):
-            if not first_page and i == 0:
-                continue
-            writer.writerow(line.split(','))
+    if not tables:
+        print("No rows downloaded.")
+        return
 
-    first_page = False
-    offset += LIMIT
-    time.sleep(0.3)
+    # Type inference is per page (e.g. an all-null column), so let Arrow widen as needed
+    dataset = pa.concat_tables(tables, promote_options="permissive")
+    dataset.to_pandas().to_csv(output_file, index=False)
+    print(f"Saved CSV to: {output_file}")
 
-print(f"Saved CSV to: {output_file}")
+if __name__ == "__main__":
+    asyncio.run(main())
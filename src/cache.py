@@ -0,0 +1,27 @@
+import msgpack
+import zstandard
+from diskcache import Disk, UNKNOWN
+from diskcache.core import MODE_BINARY, MODE_RAW
+
+class MsgpackZstdDisk(Disk):
+    """
+    diskcache Disk that stores values as zstd-compressed msgpack instead of pickle.
+    Keys keep diskcache's default encoding. Values must be msgpack-serializable
+    (dicts, lists, str, numbers, None), which covers the API's job results.
+    """
+    def __init__(self, directory, compress_level: int = 3, **kwargs):
+        self.compress_level = compress_level
+        super().__init__(directory, **kwargs)
+
+    def store(self, value, read, key=UNKNOWN):
+        if not read:
+            value = zstandard.compress(msgpack.packb(value, use_bin_type=True), self.compress_level)
+        return super().store(value, read, key=key)
+
+    def fetch(self, mode, filename, value, read):
+        data = super().fetch(mode, filename, value, read)
+        # Our values come back as bytes (inline in SQLite or from a file); entries
+        # pickled before this Disk was in use are already decoded, so pass them through.
+        if mode in (MODE_RAW, MODE_BINARY) and not read and isinstance(data, bytes):
+            data = msgpack.unpackb(zstandard.decompress(data), raw=False)
+        return data
@@ -1,7 +1,85 @@
-import pandas as pd
+from __future__ import annotations
+
 import joblib
 import os
+import sys
+import functools
+import warnings
 import numpy as np
+from numba import njit
+from typing import TYPE_CHECKING
+
+# pandas is deliberately not imported here: it costs ~300ms and tens of MB per
+# API worker, and the API only ever passes dicts.
+if TYPE_CHECKING:
+    import pandas as pd
+
+def _is_dataframe(data) -> bool:
+    """isinstance(data, pd.DataFrame) without importing pandas (if it isn't loaded, data can't be one)."""
+    pd = sys.modules.get("pandas")
+    return pd is not None and isinstance(data, pd.DataFrame)
+
+def _soft_assignments(distances: np.ndarray) -> np.ndarray:
+    """
+    Row-wise softmax(-distances) in float32.
+    Works in place on a single float32 copy, using the max-shift for numerical stability.
+    """
+    d = distances.astype(np.float32)
+    np.negative(d, out=d)
+    d -= d.max(axis=1, keepdims=True)
+    np.exp(d, out=d)
+    d /= d.sum(axis=1, keepdims=True)
+    return d
+
+# Same lambda tolerance as sklearn's PowerTransformer (np.spacing(1.0))
+_YJ_EPS = float(np.spacing(1.0))
+
+@njit(cache=True)
+def _yeo_johnson_row(x, lambdas, mean, scale, out):
+    """
+    Yeo-Johnson transform plus standardization for a single row, written into `out`.
+    Mirrors PowerTransformer.transform branch for branch so results match sklearn.
+    """
+    for i in range(x.shape[0]):
+        v = x[i]
+        lam = lambdas[i]
+        if v >= 0:
+            if abs(lam) < _YJ_EPS:
+                t = np.log1p(v)
+            else:
+                t = ((v + 1.0) ** lam - 1.0) / lam
+        else:
+            if abs(lam - 2.0) > _YJ_EPS:
+                t = -((1.0 - v) ** (2.0 - lam) - 1.0) / (2.0 - lam)
+            else:
+                t = -np.log1p(-v)
+        out[i] = (t - mean[i]) / scale[i]
+
+def _yeo_johnson_batch(X: np.ndarray, lambdas: np.ndarray, mean: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    """
+    Vectorized Yeo-Johnson transform plus standardization over an (N, F) matrix, in X's dtype.
+    A negative x uses (2 - lambda) on |x|, so both branches share one power call over
+    the whole matrix instead of sklearn's per-column loop.
+    """
+    dtype = X.dtype
+    pos = X >= 0
+    lam = np.where(pos, lambdas.astype(dtype), (2 - lambdas).astype(dtype))
+    # Where that exponent is ~0 the transform is log1p instead (same tolerance as sklearn)
+    degenerate = np.where(pos, np.abs(lambdas) < _YJ_EPS, np.abs(lambdas - 2) <= _YJ_EPS)
+    A = np.abs(X)
+
+    with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+        out = A + 1
+        np.power(out, lam, out=out)
+        out -= 1
+        out /= lam
+        if degenerate.any():
+            out[degenerate] = np.log1p(A[degenerate])
+    np.negative(out, out=out, where=~pos)
+
+    out -= mean.astype(dtype)
+    out /= scale.astype(dtype)
+    return out
 
 class ClusterPredictor:
     def __init__(self, model_path: str, preprocessor_path: str):
@@ -25,7 +103,20 @@ class ClusterPredictor:
             3: "Ultra-Whales / Institutional & Exchange Wallets"
         }
         
+        # Memoizes single-row predictions by feature tuple; identical wallets
+        # (e.g. dormant all-zero ones) skip the sklearn pipeline entirely.
+        self._predict_tuple = functools.lru_cache(maxsize=4096)(self._predict_row)
+        
         self._load_artifacts()
+        
+        # Persona name for each cluster column of the probability matrix
+        self._persona_names = [
+            self.PERSONA_MAPPING.get(c_idx, f"Cluster {c_idx}") for c_idx in range(self.model.n_clusters)
+        ]
+        
+        # Warm-up: page in the mapped arrays and sklearn code paths so the
+        # first real request doesn't pay the first-touch latency.
+        self.predict({f: 0.0 for f in self.FEATURES})
 
     def _load_artifacts(self):
         """Loads the model and preprocessor from disk."""
@@ -34,10 +125,77 @@ class ClusterPredictor:
         if not os.path.exists(self.preprocessor_path):
             raise FileNotFoundError(f"Preprocessor file not found at {self.preprocessor_path}")
             
+        # mmap_mode='r' maps the fitted arrays read-only from the page cache, so
+        # multiple uvicorn workers share one copy instead of each holding their own.
         print(f"Loading model from {self.model_path}...")
-        self.model = joblib.load(self.model_path)
+        self.model = joblib.load(self.model_path, mmap_mode='r')
         print(f"Loading preprocessor from {self.preprocessor_path}...")
-        self.preprocessor = joblib.load(self.preprocessor_path)
+        self.preprocessor = joblib.load(self.preprocessor_path, mmap_mode='r')
+        
+        # The single-row path feeds a bare ndarray, so the column order must match training
+        fitted_features = getattr(self.preprocessor, "feature_names_in_", None)
+        if fitted_features is not None and list(fitted_features) != self.FEATURES:
+            raise ValueError(f"Preprocessor was fitted on features {list(fitted_features)}, expected {self.FEATURES}")
+
+        # Fitted Yeo-Johnson parameters for the single-row kernel and the batch
+        # path (other power transforms fall back to sklearn)
+        self._yj_params = None
+        if self.preprocessor.method == "yeo-johnson":
+            n_features = len(self.FEATURES)
+            if self.preprocessor.standardize:
+                mean, scale = self.preprocessor._scaler.mean_, self.preprocessor._scaler.scale_
+            else:
+                mean, scale = np.zeros(n_features), np.ones(n_features)
+            self._yj_params = tuple(
+                np.ascontiguousarray(a, dtype=np.float64)
+                for a in (self.preprocessor.lambdas_, mean, scale)
+            )
+
+    def _transform(self, X: np.ndarray) -> np.ndarray:
+        """Applies the fitted preprocessor to a bare ndarray in FEATURES column order."""
+        # Column order was validated against the fitted names in _load_artifacts
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", message="X does not have valid feature names")
+            return self.preprocessor.transform(X)
+
+    def _predict_row(self, key: tuple[float, ...]) -> tuple[int, tuple[float, ...]]:
+        """Runs one feature row (in FEATURES order) through the model; returns (label, probabilities)."""
+        x = np.array(key, dtype=np.float64)
+
+        if self._yj_params is not None:
+            X_transformed = np.empty((1, x.shape[0]), dtype=np.float64)
+            _yeo_johnson_row(x, *self._yj_params, X_transformed[0])
+        else:
+            X_transformed = self._transform(x.reshape(1, -1))
+        distances = self.model.transform(X_transformed)
+        label = int(distances.argmin(axis=1)[0])
+        probs = _soft_assignments(distances)
+        return label, tuple(probs[0].tolist())
+
+    def predict_row(self, values: tuple[float, ...]) -> dict:
+        """
+        Predicts one wallet from its feature values, already in FEATURES order.
+        Returns the same shape as predict(dict) without going through a dict.
+        """
+        if len(values) != len(self.FEATURES):
+            raise ValueError(f"Expected {len(self.FEATURES)} feature values, got {len(values)}")
+
+        label, probs = self._predict_tuple(values)
+
+        # Fresh dicts on every call so callers never mutate a cached entry
+        return {
+            "cluster_label": label,
+            "persona": self.PERSONA_MAPPING.get(label, "Unknown"),
+            "probabilities": dict(zip(self._persona_names, probs))
+        }
+
+    def _predict_single(self, data: dict) -> dict:
+        """Fast path for one wallet: builds the feature row directly, skipping pandas."""
+        missing_cols = set(self.FEATURES) - data.keys()
+        if missing_cols:
+            raise ValueError(f"Missing required features: {missing_cols}")
+
+        return self.predict_row(tuple(float(data[f]) for f in self.FEATURES))
 
     def predict(self, data: dict | pd.DataFrame) -> dict:
         """
@@ -52,13 +210,10 @@ class ClusterPredictor:
             - persona: The human-readable persona name.
             - probabilities: A dictionary mapping each persona to its confidence score (0-1).
         """
-        import numpy as np
-        from scipy.special import softmax
-
         if isinstance(data, dict):
-            df = pd.DataFrame([data])
-        elif isinstance(data, pd.DataFrame):
-            df = data.copy()
+            return self._predict_single(data)
+        elif _is_dataframe(data):
+            df = data
         else:
             raise ValueError("Input data must be a dictionary or pandas DataFrame.")
             
@@ -66,36 +221,41 @@ class ClusterPredictor:
         if missing_cols:
             raise ValueError(f"Missing required features: {missing_cols}")
             
-        X = df[self.FEATURES]
-        
-        X_transformed = self.preprocessor.transform(X)
+        # One contiguous float32 buffer in FEATURES order, so sklearn does no further
+        # dtype coercion and the distance matmul runs on half the bytes.
+        X = np.ascontiguousarray(df[self.FEATURES].to_numpy(dtype=np.float32))
         
-        # 1. Hard Prediction (Cluster Label)
-        cluster_labels = self.model.predict(X_transformed)
+        if self._yj_params is not None:
+            X_transformed = _yeo_johnson_batch(X, *self._yj_params)
+        else:
+            X_transformed = self._transform(X)
         
-        # 2. Soft Probability (Distance-based)
         # transform() returns distance to each cluster center
         distances = self.model.transform(X_transformed)
         
+        # 1. Hard Prediction (Cluster Label)
+        # The nearest center is exactly what KMeans.predict returns, so reuse the
+        # distances instead of paying for a second pass over the centers.
+        cluster_labels = distances.argmin(axis=1)
+        
+        # 2. Soft Probability (Distance-based)
         # We want closer distance = higher probability.
         # So we take the negative distance.
-        # We apply softmax to normalize into a probability distribution (sum=1).
+        # We apply softmax to normalize into a probability distribution (sum=1),
+        # in float32 since the scores are only reported to a few decimals.
         # Multiplying by a factor (e.g., -1 or -2) can sharpen the probabilities.
         # Using -1 * distance is standard for "soft k-means".
-        probs = softmax(-distances, axis=1)
+        probs = _soft_assignments(distances)
         
-        results = []
-        for i, label in enumerate(cluster_labels):
-            prob_dict = {
-                self.PERSONA_MAPPING.get(c_idx, f"Cluster {c_idx}"): float(probs[i][c_idx])
-                for c_idx in range(probs.shape[1])
-            }
-            
-            results.append({
-                "cluster_label": int(label),
+        # tolist() converts to Python ints/floats in one C-level pass
+        results = [
+            {
+                "cluster_label": label,
                 "persona": self.PERSONA_MAPPING.get(label, "Unknown"),
-                "probabilities": prob_dict
-            })
+                "probabilities": dict(zip(self._persona_names, row_probs))
+            }
+            for label, row_probs in zip(cluster_labels.tolist(), probs.tolist())
+        ]
             
         if len(results) == 1:
             return results[0]
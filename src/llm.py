@@ -1,63 +1,169 @@
 import os
 import time
-from typing import Dict, Optional
-from groq import Groq
-from huggingface_hub import InferenceClient
+import asyncio
+import hashlib
+import math
+from typing import Dict, List, Optional, Tuple
+from groq import AsyncGroq
+from huggingface_hub import AsyncInferenceClient
+from aiolimiter import AsyncLimiter
+from diskcache import Cache
 from dotenv import load_dotenv
 load_dotenv()
 
+# Explanations are cached by prompt, so identical wallets never hit the API twice
+LLM_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".llm_cache")
+LLM_CACHE_TTL = 30 * 86400
+
+_PROMPT_TMPL = (
+    "You are a crypto analytics bot with a witty, slightly roasting personality. "
+    "Analyze this wallet:\n"
+    "Persona: {persona}\n"
+    "Stats: {stats}\n\n"
+    "Task: Write a 2-3 sentence 'Roast' or 'Insight' about this user. "
+    "Explain WHY they fit this persona based on the stats. "
+    "Be specific but concise."
+)
+
+# Groq free-tier request cap for llama-3.1-8b-instant
+GROQ_REQUESTS_PER_MINUTE = 30
+
+def _bucket(value: float, digits: int = 2) -> float:
+    """
+    Rounds to `digits` significant figures (a log10-scale bucket), so wallets
+    with near-identical stats produce the same prompt and share a cache entry.
+    """
+    if not value or not math.isfinite(value):
+        return 0.0
+    return round(value, digits - 1 - math.floor(math.log10(abs(value))))
+
+class RateLimiter:
+    """
+    Caps calls to `max_concurrent` in flight and, if given, `requests_per_minute`
+    overall (token bucket, refilled continuously). Use as `async with limiter:`.
+    The primitives are created per event loop, so the limiter survives the
+    sync wrapper's asyncio.run calls.
+    """
+    def __init__(self, requests_per_minute: Optional[int], max_concurrent: int = 16):
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrent = max_concurrent
+        self._loop = None
+
+    def _bind(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._bucket = (
+                AsyncLimiter(self.requests_per_minute, time_period=60)
+                if self.requests_per_minute else None
+            )
+
+    async def __aenter__(self):
+        self._bind()
+        await self._semaphore.acquire()
+        if self._bucket is None:
+            return self
+        try:
+            await self._bucket.acquire()
+        except BaseException:
+            self._semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._semaphore.release()
+
 class PersonaExplainer:
-    def __init__(self):
+    def __init__(self, requests_per_minute: int = GROQ_REQUESTS_PER_MINUTE, concurrency: int = 16):
         self.groq_api_key = os.getenv("GROQ_API_KEY")
         self.hf_api_token = os.getenv("HF_API_TOKEN")
         
-        self.groq_client = Groq(api_key=self.groq_api_key) if self.groq_api_key else None
-        self.hf_client = InferenceClient(token=self.hf_api_token) if self.hf_api_token else None
+        self.groq_client = AsyncGroq(api_key=self.groq_api_key) if self.groq_api_key else None
+        self.hf_client = AsyncInferenceClient(token=self.hf_api_token) if self.hf_api_token else None
+        self.cache = Cache(LLM_CACHE_DIR)
+        # Shared by every batch (and every job in the API), so the caps hold globally.
+        # Groq gets its per-minute quota; HF is only a fallback for prompts Groq
+        # failed on, so it is just concurrency-capped (its 429s surface as failures).
+        self.groq_limiter = RateLimiter(requests_per_minute, concurrency)
+        self.hf_limiter = RateLimiter(None, concurrency)
 
     def generate_explanation(self, persona: str, stats: Dict[str, float]) -> str:
         """
         Generates a humorous/insightful explanation of the wallet's persona.
+        Blocking wrapper for callers without an event loop; async code should
+        await generate_explanation_async instead.
         """
-        prompt = self._construct_prompt(persona, stats)
-        
+        return asyncio.run(self.generate_explanation_async(persona, stats))
+
+    async def generate_explanation_async(self, persona: str, stats: Dict[str, float]) -> str:
+        """
+        Async version of generate_explanation.
+        """
+        results = await self.generate_explanation_batch([(persona, stats)])
+        return results[0]
+
+    async def generate_explanation_batch(self, pairs: List[Tuple[str, Dict[str, float]]]) -> List[str]:
+        """
+        Generates explanations for many (persona, stats) pairs concurrently,
+        within the explainer's per-provider limits; prompts Groq fails on are
+        retried on Hugging Face. Results come back in the order of `pairs`.
+        """
+        prompts = [self._construct_prompt(persona, stats) for persona, stats in pairs]
+        keys = [hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest() for prompt in prompts]
+        cached = [self.cache.get(key) for key in keys]
+        # Only prompts without a cached explanation go to the APIs
+        todo = [i for i, hit in enumerate(cached) if hit is None]
+
+        async def guarded(limiter, call, prompt):
+            async with limiter:
+                return await call(prompt)
+
         # Try Groq First (Fastest)
-        if self.groq_client:
-            try:
-                return self._call_groq(prompt)
-            except Exception as e:
-                print(f"Groq API failed: {e}. Falling back...")
-        
-        # Fallback to Hugging Face
-        if self.hf_client:
-            try:
-                return self._call_hf(prompt)
-            except Exception as e:
-                print(f"HF API failed: {e}.")
-        
-        return "Analysis unavailable (AI models busy)."
+        results = [None] * len(todo)
+        if todo and self.groq_client:
+            results = await asyncio.gather(
+                *(guarded(self.groq_limiter, self._call_groq_async, prompts[i]) for i in todo),
+                return_exceptions=True,
+            )
+            for r in results:
+                if isinstance(r, Exception):
+                    print(f"Groq API failed: {r}. Falling back...")
+
+        # Fallback to Hugging Face for whatever is still missing
+        failed = [i for i, r in enumerate(results) if not isinstance(r, str)]
+        if failed and self.hf_client:
+            retried = await asyncio.gather(
+                *(guarded(self.hf_limiter, self._call_hf_async, prompts[todo[i]]) for i in failed),
+                return_exceptions=True,
+            )
+            for i, r in zip(failed, retried):
+                if isinstance(r, Exception):
+                    print(f"HF API failed: {r}.")
+                results[i] = r
+
+        for i, r in zip(todo, results):
+            if isinstance(r, str):
+                self.cache.set(keys[i], r, expire=LLM_CACHE_TTL)
+                cached[i] = r
+
+        return [r if r is not None else "Analysis unavailable (AI models busy)." for r in cached]
 
     def _construct_prompt(self, persona: str, stats: Dict) -> str:
-        # Simplify stats for the LLM to avoid token bloat
-        key_stats = {
-            "Transactions": int(stats.get('tx_count', 0)),
-            "NFT Volume (USD)": f"${stats.get('total_nft_volume_usd', 0):,.2f}",
-            "Gas Spent (ETH)": f"{stats.get('total_gas_spent', 0):.4f}",
-            "Active Days": int(stats.get('active_days', 0)),
-            "DEX Trades": int(stats.get('dex_trades', 0))
-        }
-        
-        return (
-            f"You are a crypto analytics bot with a witty, slightly roasting personality. "
-            f"Analyze this wallet:\n"
-            f"Persona: {persona}\n"
-            f"Stats: {key_stats}\n\n"
-            f"Task: Write a 2-3 sentence 'Roast' or 'Insight' about this user. "
-            f"Explain WHY they fit this persona based on the stats. "
-            f"Be specific but concise."
+        # Simplify stats for the LLM to avoid token bloat; values are bucketed
+        # to 2 significant figures so similar wallets hit the same cache entry
+        key_stats = (
+            ("Transactions", f"{_bucket(stats.get('tx_count', 0)):.0f}"),
+            ("NFT Volume (USD)", f"${_bucket(stats.get('total_nft_volume_usd', 0)):,.2f}"),
+            ("Gas Spent (ETH)", f"{_bucket(stats.get('total_gas_spent', 0)):.4f}"),
+            ("Active Days", f"{_bucket(stats.get('active_days', 0)):.0f}"),
+            ("DEX Trades", f"{_bucket(stats.get('dex_trades', 0)):.0f}"),
         )
+        stats_str = ", ".join(f"{k}: {v}" for k, v in key_stats)
+        return _PROMPT_TMPL.format(persona=persona, stats=stats_str)
 
-    def _call_groq(self, prompt: str) -> str:
-        chat_completion = self.groq_client.chat.completions.create(
+    async def _call_groq_async(self, prompt: str) -> str:
+        chat_completion = await self.groq_client.chat.completions.create(
             messages=[
                 {"role": "system", "content": "You are a witty crypto analyst."},
                 {"role": "user", "content": prompt}
@@ -68,9 +174,9 @@ class PersonaExplainer:
         )
         return chat_completion.choices[0].message.content
 
-    def _call_hf(self, prompt: str) -> str:
+    async def _call_hf_async(self, prompt: str) -> str:
         # Using Mistral-7B-Instruct via HF Inference API
-        return self.hf_client.text_generation(
+        return await self.hf_client.text_generation(
             prompt, 
             model="mistralai/Mistral-7B-Instruct-v0.2", 
             max_new_tokens=200,
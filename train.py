@@ -1,6 +1,25 @@
 import pandas as pd
+
+# Route KMeans/PowerTransformer through Intel's oneDAL kernels when
+# scikit-learn-intelex is installed; must run before the sklearn imports.
+try:
+    from sklearnex import patch_sklearn
+    patch_sklearn()
+except ImportError:
+    pass
+
+# RAPIDS cuML KMeans on the GPU when it is installed
+try:
+    import cupy as cp
+    from cuml.cluster import KMeans as cuKMeans
+    GPU = True
+except ImportError:
+    GPU = False
+
 from sklearn.preprocessing import PowerTransformer
-from sklearn.cluster import KMeans
+from sklearn.cluster import MiniBatchKMeans
+import numpy as np
+from scipy.optimize import linear_sum_assignment
 import joblib
 import os
 from tqdm import tqdm
@@ -9,9 +28,11 @@ import time
 DATA_PATH = "wallet_dataset.csv"
 PREPROCESSOR_PATH = "wallet_power_transformer.pkl"
 MODEL_PATH = "kmeans_model.pkl"
-OUTPUT_LABELED_DATA_PATH = "wallet_dataset_labeled.csv"
+OUTPUT_LABELED_DATA_PATH = "wallet_dataset_labeled.parquet"
 N_CLUSTERS = 4
 RANDOM_STATE = 42
+# Rows used to fit the Yeo-Johnson lambdas; the full matrix is only transformed
+PREPROCESSOR_FIT_SAMPLES = 200_000
 
 FEATURES = [
     'tx_count', 'active_days', 'avg_tx_per_day', 'total_gas_spent',
@@ -28,7 +49,34 @@ PERSONA_MAPPING = {
     3: "Ultra-Whales / Institutional & Exchange Wallets"
 }
 
-def train_model():
+def align_to_previous_model(kmeans, path=MODEL_PATH):
+    """
+    Reorders the new centroids so each cluster keeps the label of the closest
+    centroid in the previously saved model. PERSONA_MAPPING is keyed by label,
+    and a refit is free to return the same clusters in a different order.
+    """
+    if not os.path.exists(path):
+        return
+    previous = joblib.load(path)
+    old_centers = getattr(previous, "cluster_centers_", None)
+    if old_centers is None or old_centers.shape != kmeans.cluster_centers_.shape:
+        return
+
+    cost = np.linalg.norm(old_centers[:, None, :] - kmeans.cluster_centers_[None, :, :], axis=2)
+    _, order = linear_sum_assignment(cost)
+    relabel = np.empty_like(order)
+    relabel[order] = np.arange(len(order))
+
+    kmeans.cluster_centers_ = kmeans.cluster_centers_[order]
+    if hasattr(kmeans, "labels_"):
+        kmeans.labels_ = relabel[kmeans.labels_]
+
+def train_model(save_labeled=True):
+    """
+    Fits the preprocessor and KMeans, saves both, and returns the labeled
+    DataFrame (None if the raw data is missing). The labeled dataset is only
+    written to disk when save_labeled is set.
+    """
     print("Starting model training process...")
     
     steps = [
@@ -49,32 +97,57 @@ def train_model():
             return
         pbar.update(1)
 
-        X = df[FEATURES]
+        # float32 halves the bytes streamed through the transform and the KMeans
+        # distance kernel; kept as a DataFrame so the transformer records feature names
+        X = df[FEATURES].astype(np.float32, copy=False)
 
         pbar.set_description(f"Step: {steps[1]}")
         preprocessor = PowerTransformer(method='yeo-johnson')
-        X_transformed = preprocessor.fit_transform(X)
+        sample_idx = np.random.default_rng(RANDOM_STATE).choice(
+            len(X), size=min(len(X), PREPROCESSOR_FIT_SAMPLES), replace=False
+        )
+        preprocessor.fit(X.iloc[sample_idx])
+        X_transformed = preprocessor.transform(X)
 
         joblib.dump(preprocessor, PREPROCESSOR_PATH)
         pbar.update(1)
 
         pbar.set_description(f"Step: {steps[2]}")
-        kmeans = KMeans(n_clusters=N_CLUSTERS, random_state=RANDOM_STATE, n_init='auto')
-        df['Cluster_labels'] = kmeans.fit_predict(X_transformed)
+        if GPU:
+            gpu_kmeans = cuKMeans(n_clusters=N_CLUSTERS, n_init=10, random_state=RANDOM_STATE)
+            gpu_kmeans.fit(cp.asarray(X_transformed))
+            # The API loads this pickle without cuML, so save a plain sklearn estimator
+            kmeans = gpu_kmeans.as_sklearn()
+        else:
+            # Mini-batch updates scale to millions of wallets; K=4 centroids come out
+            # near-identical to full-batch Lloyd
+            kmeans = MiniBatchKMeans(
+                n_clusters=N_CLUSTERS, batch_size=8192, n_init=10,
+                max_iter=300, random_state=RANDOM_STATE
+            )
+            kmeans.fit(X_transformed)
+        align_to_previous_model(kmeans)
+        df['Cluster_labels'] = kmeans.predict(X_transformed)
 
         joblib.dump(kmeans, MODEL_PATH)
         pbar.update(1)
 
         pbar.set_description(f"Step: {steps[3]}")
 
-        df['Persona'] = df['Cluster_labels'].map(PERSONA_MAPPING)
+        # int8 codes + a 4-entry category table instead of one string per row
+        df['Persona'] = pd.Categorical.from_codes(
+            df['Cluster_labels'].to_numpy(dtype=np.int8),
+            categories=[PERSONA_MAPPING[i] for i in range(N_CLUSTERS)]
+        )
         pbar.update(1)
 
         pbar.set_description(f"Step: {steps[4]}")
-        df.to_csv(OUTPUT_LABELED_DATA_PATH, index=False)
+        if save_labeled:
+            df.to_parquet(OUTPUT_LABELED_DATA_PATH, engine='pyarrow', compression='zstd', index=False)
         pbar.update(1)
         
     print("\nModel training and data labeling complete.")
+    return df
 
 if __name__ == "__main__":
     train_model()
@@ -3,13 +3,46 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.manifold import TSNE
-from sklearn.preprocessing import MinMaxScaler
+from sklearn.decomposition import PCA
+import joblib
+import hashlib
 import os
+from numba import njit, prange, get_num_threads
 
-INPUT_FILE = "wallet_dataset_labeled.csv"
+# RAPIDS cuML t-SNE on the GPU, else openTSNE (FFT-accelerated, multithreaded),
+# else sklearn
+try:
+    from cuml.manifold import TSNE as cuTSNE
+    GPU = True
+except ImportError:
+    GPU = False
+
+try:
+    from openTSNE import TSNE as OpenTSNE
+except ImportError:
+    OpenTSNE = None
+
+INPUT_FILE = "wallet_dataset_labeled.parquet"
+PREPROCESSOR_PATH = "wallet_power_transformer.pkl"
 OUTPUT_DIR = "docs"
 RADAR_CHART_FILE = os.path.join(OUTPUT_DIR, "persona_radar_chart.png")
 TSNE_PLOT_FILE = os.path.join(OUTPUT_DIR, "clusters_tsne.png")
+TSNE_PLOT_WEBP_FILE = os.path.join(OUTPUT_DIR, "clusters_tsne.webp")
+# Rows per persona fed to t-SNE; beyond this the scatter is saturated anyway
+TSNE_SAMPLES_PER_PERSONA = 5000
+
+RADAR_FEATURES = [
+    'tx_count', 'active_days', 'total_gas_spent', 
+    'total_nft_volume_usd', 'dex_trades', 'total_traded_usd'
+]
+
+TSNE_FEATURES = [
+    'tx_count', 'active_days', 'avg_tx_per_day', 'total_gas_spent',
+    'total_nft_buys', 'total_nft_sells', 'total_nft_volume_usd',
+    'unique_nfts_owned', 'dex_trades', 'avg_trade_size_usd',
+    'total_traded_usd', 'erc20_receive_usd', 'erc20_send_usd',
+    'native_balance_delta'
+]
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
@@ -17,21 +50,68 @@ def load_data():
     if not os.path.exists(INPUT_FILE):
         print(f"Error: {INPUT_FILE} not found.")
         return None
-    return pd.read_csv(INPUT_FILE)
+    # Only the plotted columns, as float32
+    features = list(dict.fromkeys(RADAR_FEATURES + TSNE_FEATURES))
+    dtypes = {c: np.float32 for c in features}
+    if INPUT_FILE.endswith(".parquet"):
+        return pd.read_parquet(INPUT_FILE, columns=features + ['Persona']).astype(dtypes)
+    return pd.read_csv(INPUT_FILE, usecols=features + ['Persona'], dtype=dtypes)
+
+@njit(parallel=True, cache=True)
+def _persona_means(codes, X, k, n_chunks):
+    """
+    Per-persona column means in one parallel pass. Each chunk of rows
+    accumulates its own sums/counts (no shared writes), then the chunks are
+    reduced. Rows with a negative code (no persona) are skipped.
+    """
+    n, f = X.shape
+    sums = np.zeros((n_chunks, k, f))
+    counts = np.zeros((n_chunks, k))
+    step = (n + n_chunks - 1) // n_chunks
+    for c in prange(n_chunks):
+        for i in range(c * step, min(n, (c + 1) * step)):
+            code = codes[i]
+            if code < 0:
+                continue
+            counts[c, code] += 1
+            for j in range(f):
+                sums[c, code, j] += X[i, j]
+    total = counts.sum(axis=0)
+    means = sums.sum(axis=0)
+    for code in range(k):
+        if total[code] > 0:
+            for j in range(f):
+                means[code, j] /= total[code]
+    return means, total
 
-def plot_radar_chart(df):
+def transform_features(df):
+    """
+    Applies the PowerTransformer fitted in train.py, so both plots show the
+    Gaussianized space KMeans clustered in. Returns a DataFrame aligned to df.
+    """
+    preprocessor = joblib.load(PREPROCESSOR_PATH)
+    X = preprocessor.transform(df[TSNE_FEATURES].fillna(0))
+    return pd.DataFrame(X, columns=TSNE_FEATURES, index=df.index)
+
+def plot_radar_chart(df, X):
     print("Generating Radar Chart")
     
-    features = [
-        'tx_count', 'active_days', 'total_gas_spent', 
-        'total_nft_volume_usd', 'dex_trades', 'total_traded_usd'
-    ]
-    
-    scaler = MinMaxScaler()
-    df_scaled = df.copy()
-    df_scaled[features] = scaler.fit_transform(df[features])
+    features = RADAR_FEATURES
     
-    persona_means = df_scaled.groupby('Persona')[features].mean()
+    # Persona means of the transformed features, min-max scaled for display.
+    # Min-max is linear, so scaling the K means with the column-wide min/max
+    # gives the same values as scaling every row first
+    personas = pd.Categorical(df['Persona'])
+    values = X[features].to_numpy(np.float32)
+    means, counts = _persona_means(
+        personas.codes.astype(np.int64), values, len(personas.categories), get_num_threads()
+    )
+    col_min = values.min(axis=0)
+    col_range = values.max(axis=0) - col_min
+    col_range[col_range == 0] = 1.0
+    persona_means = pd.DataFrame(
+        (means - col_min) / col_range, index=personas.categories, columns=features
+    )[counts > 0]
     
     labels=np.array(features)
     num_vars = len(labels)
@@ -42,47 +122,74 @@ def plot_radar_chart(df):
     
     colors = sns.color_palette("husl", len(persona_means))
     
-    for idx, (persona, row) in enumerate(persona_means.iterrows()):
-        values = row.tolist()
-        values += values[:1] 
-        ax.plot(angles, values, color=colors[idx], linewidth=2, label=persona)
-        ax.fill(angles, values, color=colors[idx], alpha=0.1)
+    # One row per persona, closed back onto the first axis; plotted in a single call
+    values = persona_means.to_numpy()
+    values = np.concatenate([values, values[:, :1]], axis=1)
+    ax.set_prop_cycle(color=colors)
+    lines = ax.plot(angles, values.T, linewidth=2)
+    for idx, row in enumerate(values):
+        ax.fill(angles, row, color=colors[idx], alpha=0.1)
     
     ax.set_theta_offset(np.pi / 2)
     ax.set_theta_direction(-1)
     ax.set_xticks(angles[:-1])
     ax.set_xticklabels(labels)
     
-    plt.legend(loc='upper right', bbox_to_anchor=(1.3, 1.1))
+    ax.legend(lines, persona_means.index, loc='upper right', bbox_to_anchor=(1.3, 1.1))
     plt.title("Persona Behavioral Fingerprints (Normalized)", y=1.08)
     
     plt.savefig(RADAR_CHART_FILE, bbox_inches='tight', dpi=300)
     print(f"Saved radar chart to {RADAR_CHART_FILE}")
     plt.close()
 
-def plot_tsne(df):
+def plot_tsne(df, X):
     print("Generating t-SNE Plot (this may take a moment)...")
     
-    feature_cols = [
-        'tx_count', 'active_days', 'avg_tx_per_day', 'total_gas_spent',
-        'total_nft_buys', 'total_nft_sells', 'total_nft_volume_usd',
-        'unique_nfts_owned', 'dex_trades', 'avg_trade_size_usd',
-        'total_traded_usd', 'erc20_receive_usd', 'erc20_send_usd',
-        'native_balance_delta'
-    ]
-    
-    X = df[feature_cols].fillna(0)
-    
-    tsne = TSNE(n_components=2, random_state=42, init='random', learning_rate='auto')
-    X_embedded = tsne.fit_transform(X)
+    # Stratified sample: up to TSNE_SAMPLES_PER_PERSONA random rows of each persona
+    shuffled = df.sample(frac=1, random_state=42)
+    sample = shuffled[shuffled.groupby('Persona', observed=True).cumcount() < TSNE_SAMPLES_PER_PERSONA]
+    
+    X = X.loc[sample.index].to_numpy()
+    
+    # Backend and its settings; all of it goes into the cache key below
+    pca_params = dict(n_components=min(14, X.shape[1]), random_state=42)
+    if GPU:
+        backend, tsne_params = "cuml", dict(n_components=2, random_state=42)
+    elif OpenTSNE is not None:
+        backend, tsne_params = "opentsne", dict(n_components=2, n_jobs=-1, random_state=42, negative_gradient_method='fft')
+    else:
+        backend, tsne_params = "sklearn", dict(n_components=2, random_state=42, init='random', learning_rate='auto')
+    
+    # The embedding only depends on the input matrix, backend and parameters,
+    # so reuse it across runs, e.g. when only the plot styling changed
+    key = repr((backend, sorted(pca_params.items()), sorted(tsne_params.items()))).encode()
+    digest = hashlib.blake2b(np.ascontiguousarray(X).tobytes() + key, digest_size=16).hexdigest()
+    cache_file = os.path.join(OUTPUT_DIR, f"tsne_{digest}.npy")
+    
+    if os.path.exists(cache_file):
+        print(f"Using cached t-SNE embedding {cache_file}")
+        X_embedded = np.load(cache_file)
+    else:
+        # PCA first so TSNE's neighbor search runs on decorrelated components
+        X_pca = PCA(**pca_params).fit_transform(X)
+        
+        if backend == "cuml":
+            X_embedded = np.asarray(cuTSNE(**tsne_params).fit_transform(X_pca))
+        elif backend == "opentsne":
+            X_embedded = np.asarray(OpenTSNE(**tsne_params).fit(X_pca))
+        else:
+            X_embedded = TSNE(**tsne_params).fit_transform(X_pca)
+        np.save(cache_file, X_embedded)
     
     plt.figure(figsize=(12, 8))
     sns.scatterplot(
         x=X_embedded[:, 0], 
         y=X_embedded[:, 1], 
-        hue=df['Persona'], 
+        hue=sample['Persona'].to_numpy(), 
         palette='husl',
-        alpha=0.7
+        alpha=0.7,
+        # One raster layer instead of a vector glyph per point
+        rasterized=True
     )
     
     plt.title("t-SNE Projection of Wallet Clusters")
@@ -91,13 +198,16 @@ def plot_tsne(df):
     plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
     
     plt.tight_layout()
-    plt.savefig(TSNE_PLOT_FILE, dpi=300)
-    print(f"Saved t-SNE plot to {TSNE_PLOT_FILE}")
+    plt.savefig(TSNE_PLOT_FILE, dpi=150)
+    # Much smaller copy for the web (written through Pillow)
+    plt.savefig(TSNE_PLOT_WEBP_FILE, dpi=150)
+    print(f"Saved t-SNE plot to {TSNE_PLOT_FILE} and {TSNE_PLOT_WEBP_FILE}")
     plt.close()
 
 if __name__ == "__main__":
     df = load_data()
     if df is not None:
-        plot_radar_chart(df)
-        plot_tsne(df)
+        X = transform_features(df)
+        plot_radar_chart(df, X)
+        plot_tsne(df, X)
         print("Visualization complete.")